@@ -1,16 +1,424 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import yt_dlp
+from yt_dlp.utils import determine_ext, determine_protocol
 import json
 import re
 import requests
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import base64
+import gzip
+import hashlib
+import shutil
 import tempfile
+import threading
 import os
 import time
 
+# Codificador JSON rápido y brotli son opcionales
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag'])
+
+def best_hls_format_selector(max_height=None, max_bandwidth=None):
+    """Selector de formato de yt-dlp: mejor HLS dentro de los límites, si no el HLS de menor calidad"""
+    limits = ''
+    if max_height:
+        limits += f'[height<=?{max_height}]'
+    if max_bandwidth:
+        limits += f'[tbr<=?{max_bandwidth}]'
+    return f'best*[protocol^=m3u8]{limits}/worst*[protocol^=m3u8]/best*'
+
+
+# Perfiles de extracción: cada uno define las opciones extra de yt-dlp y si
+# hace falta el procesado completo (ordenar/seleccionar formatos, subtítulos...)
+_SKIP_EXTRAS_OPTS = {
+    'noplaylist': True,
+    'writesubtitles': False,
+    'writeautomaticsub': False,
+    'writethumbnail': False,
+    'getcomments': False,
+    'check_formats': False,
+    # Playlists/canales: no resolver entradas fuera del modo playlist
+    'extract_flat': 'in_playlist',
+    'playlistend': 1,
+}
+
+# No pedir manifiestos DASH ni subtítulos traducidos
+_HLS_EXTRACTOR_ARGS = {'youtube': {'skip': ['dash', 'translated_subs']}}
+# Sin formatos: no hace falta ningún manifiesto
+_METADATA_EXTRACTOR_ARGS = {'youtube': {'skip': ['hls', 'dash', 'translated_subs']}}
+
+EXTRACTION_PROFILES = {
+    'full': {
+        'ydl_opts': {
+            'extract_flat': 'in_playlist',
+            'playlistend': 1,
+        },
+        'process': True,
+    },
+    'hls_only': {
+        'ydl_opts': {
+            **_SKIP_EXTRAS_OPTS,
+            'extractor_args': _HLS_EXTRACTOR_ARGS,
+        },
+        'process': False,
+    },
+    'best_only': {
+        'ydl_opts': {
+            **_SKIP_EXTRAS_OPTS,
+            'extractor_args': _HLS_EXTRACTOR_ARGS,
+            # yt-dlp selecciona el mejor HLS; get_best_hls añade los límites al selector
+            'format': best_hls_format_selector(),
+            'ignore_no_formats_error': True,
+        },
+        'process': True,
+    },
+    'metadata_only': {
+        'ydl_opts': {
+            **_SKIP_EXTRAS_OPTS,
+            'extract_flat': True,
+            'extractor_args': _METADATA_EXTRACTOR_ARGS,
+        },
+        'process': False,
+    },
+}
+
+
+def _parse_int(value, name, minimum, description):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a {description} integer")
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a {description} integer")
+    if parsed < minimum or (isinstance(value, float) and value != parsed):
+        raise ValueError(f"{name} must be a {description} integer")
+    return parsed
+
+
+def parse_positive_int(value, name):
+    """Convierte un parámetro opcional en entero positivo (ValueError si no es válido)"""
+    return _parse_int(value, name, 1, 'positive')
+
+
+def parse_non_negative_int(value, name):
+    """Convierte un parámetro opcional en entero >= 0 (ValueError si no es válido)"""
+    return _parse_int(value, name, 0, 'non-negative')
+
+# Modo playlist: paginación y paralelismo acotado
+PLAYLIST_DEFAULT_LIMIT = 50
+PLAYLIST_MAX_LIMIT = 200
+PLAYLIST_DEFAULT_CONCURRENCY = 4
+PLAYLIST_MAX_CONCURRENCY = 8
+
+
+def _url_fingerprint(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+
+
+def encode_playlist_cursor(url, offset):
+    """Genera un cursor opaco para continuar una playlist desde offset"""
+    payload = json.dumps({'u': _url_fingerprint(url), 'o': offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_playlist_cursor(url, cursor):
+    """Devuelve el offset guardado en el cursor (debe corresponder a la misma URL)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        offset = int(payload['o'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if payload.get('u') != _url_fingerprint(url) or offset < 0:
+        raise ValueError("Cursor does not belong to this URL")
+    return offset
+
+# Directorio de cookies subidas (Docker)
+COOKIES_DIR = os.path.join('/app', 'cookies')
+COOKIES_FINGERPRINT_MAX_BYTES = 256 * 1024
+
+# Caché de respuestas de extracción (ETag / 304)
+EXTRACT_CACHE_TTL = int(os.environ.get('EXTRACT_CACHE_TTL', 60))
+EXTRACT_CACHE_MAX_ENTRIES = 256
+EXTRACT_CACHE_MAX_PROJECTIONS = 8
+COMPRESSION_MIN_SIZE = 1024
+
+# Campos de formato que se pueden pedir con fields=
+FORMAT_FIELDS = (
+    'format_id', 'url', 'ext', 'protocol', 'quality', 'height', 'width', 'fps', 'tbr', 'abr', 'vbr',
+    'format_note', 'filesize', 'language', 'referer', 'expires', 'host', 'source', 'detected',
+)
+
+
+def dumps_json(obj):
+    """Serializa a bytes JSON usando orjson si está disponible"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def auth_fingerprint(cookies_file=None, cookies_dict=None, headers=None, cookies_content=None):
+    """Huella de las credenciales de una petición (cookies y headers)"""
+    # El contenido del archivo de cookies cuenta: renovar las cookies en el mismo archivo cambia la huella.
+    # Solo para archivos del directorio de cookies y con tamaño limitado; si no, basta con la ruta.
+    cookies_file_hash = None
+    if cookies_file and isinstance(cookies_file, str):
+        real_path = os.path.realpath(cookies_file)
+        if real_path.startswith(os.path.realpath(COOKIES_DIR) + os.sep) and os.path.isfile(real_path):
+            stat = os.stat(real_path)
+            if stat.st_size <= COOKIES_FINGERPRINT_MAX_BYTES:
+                with open(real_path, 'rb') as f:
+                    cookies_file_hash = hashlib.sha1(f.read(COOKIES_FINGERPRINT_MAX_BYTES)).hexdigest()
+            else:
+                cookies_file_hash = [stat.st_size, stat.st_mtime_ns]
+    material = dumps_json([cookies_file, cookies_file_hash, cookies_dict, headers, cookies_content])
+    return hashlib.sha1(material).hexdigest()
+
+
+def parse_fields(fields):
+    """Convierte 'format_id,height,url' (o una lista) en una tupla normalizada (sin duplicados, ordenada)"""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    if not isinstance(fields, (list, tuple)):
+        raise ValueError("fields must be a comma-separated string or a list")
+    requested = {str(f).strip() for f in fields if f and str(f).strip()}
+    unknown = requested.difference(FORMAT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(sorted(requested)) or None
+
+
+def project_formats(formats, fields):
+    """Se queda solo con los campos pedidos de cada formato"""
+    if not fields:
+        return formats
+    return [{k: fmt.get(k) for k in fields} for fmt in formats if fmt is not None]
+
+
+class ExtractionCache:
+    """Caché en memoria de respuestas de extracción con TTL"""
+    def __init__(self, ttl=EXTRACT_CACHE_TTL, max_entries=EXTRACT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expires'] > time.time():
+                return entry
+            self._entries.pop(key, None)
+            return None
+    
+    def set(self, key, payload, formats_key):
+        entry = {
+            'payload': payload,
+            'formats_key': formats_key,
+            'expires': time.time() + self.ttl,
+            'bodies': {},   # (proyección, encoding) -> bytes
+            'etags': {},    # proyección -> etag
+            # gthread: varios hilos pueden servir la misma entrada a la vez
+            'lock': threading.Lock(),
+        }
+        with self._lock:
+            if self.ttl <= 0:
+                return entry
+            while len(self._entries) >= self.max_entries:
+                # Expulsar la entrada más antigua
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = entry
+        return entry
+
+
+extraction_cache = ExtractionCache()
+
+# Caché negativa: fallos del origen por endpoint + URL + perfil + huella de credenciales.
+# Solo se guardan las categorías con TTL; el resto (red, errores propios) no se cachea.
+NEGATIVE_CACHE_TTLS = {
+    'ip_restricted': 120,
+    'unsupported_url': 900,
+    'unavailable': 300,
+}
+NEGATIVE_CACHE_MAX_ENTRIES = 1024
+
+_FAILURE_PATTERNS = [
+    ('ip_restricted', ('generated for another IP address', 'restricciones de IP')),
+    ('unsupported_url', ('Unsupported URL', 'is not a valid URL')),
+    ('unavailable', ('No se pudo extraer publinkData', 'Video unavailable', 'This video is not available', 'Private video',
+                     'has been removed', 'does not exist', 'HTTP Error 404', 'HTTP Error 410')),
+]
+
+
+def classify_extraction_error(message):
+    """Clasifica el mensaje de error de una extracción en una categoría"""
+    for category, patterns in _FAILURE_PATTERNS:
+        if any(pattern in message for pattern in patterns):
+            return category
+    return 'other'
+
+
+class ExtractionError(Exception):
+    """Fallo del origen (yt-dlp o pCloud), no de la petición ni del servicio"""
+    @property
+    def category(self):
+        return classify_extraction_error(str(self))
+
+
+# Errores que se propagan como ExtractionError al envolver mensajes
+UPSTREAM_ERRORS = (ExtractionError, yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError)
+
+
+def error_category(error):
+    """Categoría de una excepción; las que no vienen del origen son 'other'"""
+    return error.category if isinstance(error, ExtractionError) else 'other'
+
+
+class FailureCache:
+    """Caché en memoria de extracciones fallidas"""
+    def __init__(self, ttls=NEGATIVE_CACHE_TTLS, max_entries=NEGATIVE_CACHE_MAX_ENTRIES):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['expires'] > time.time():
+                return entry
+            self._entries.pop(key, None)
+            return None
+    
+    def record(self, key, error):
+        """Guarda un fallo del origen categorizado; devuelve None si no se debe cachear"""
+        if not isinstance(error, ExtractionError) or error.category not in self.ttls:
+            return None
+        entry = {
+            'error': str(error),
+            'category': error.category,
+            'expires': time.time() + self.ttls[error.category],
+        }
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = entry
+        return entry
+
+
+failure_cache = FailureCache()
+
+
+def failure_response(entry, cached=False):
+    """Respuesta de error con categoría y Retry-After"""
+    retry_after = max(1, int(entry['expires'] - time.time()))
+    response = jsonify({
+        'error': entry['error'],
+        'error_category': entry['category'],
+        'cached': cached,
+        'retry_after': retry_after
+    })
+    response.status_code = 500
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def extraction_error_response(key, error):
+    """Respuesta para un fallo de extracción, guardándolo en la caché negativa si corresponde"""
+    entry = failure_cache.record(key, error)
+    if entry:
+        return failure_response(entry)
+    return jsonify({
+        'error': str(error),
+        'error_category': error_category(error),
+        'cached': False
+    }), 500
+
+
+def _entry_body(entry, fields):
+    """Cuerpo JSON (sin comprimir) y ETag de una proyección, serializado una sola vez"""
+    projection = ','.join(fields) if fields else '*'
+    with entry['lock']:
+        body = entry['bodies'].get((projection, None))
+        if body is not None:
+            return projection, body, entry['etags'][projection]
+        
+        # Limitar las proyecciones guardadas por entrada: expulsar la más antigua
+        while len(entry['etags']) >= EXTRACT_CACHE_MAX_PROJECTIONS:
+            oldest = next(iter(entry['etags']))
+            entry['etags'].pop(oldest, None)
+            for key in [k for k in entry['bodies'] if k[0] == oldest]:
+                entry['bodies'].pop(key, None)
+        payload = dict(entry['payload'])
+        formats_key = entry['formats_key']
+        payload[formats_key] = project_formats(payload[formats_key], fields)
+        body = dumps_json(payload)
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        entry['bodies'][(projection, None)] = body
+        entry['etags'][projection] = etag
+        return projection, body, etag
+
+
+def _entry_encoded_body(entry, projection, body, encoding):
+    """Cuerpo comprimido de una proyección, comprimido una sola vez"""
+    with entry['lock']:
+        encoded = entry['bodies'].get((projection, encoding))
+        if encoded is None:
+            if encoding == 'br':
+                encoded = brotli.compress(body, quality=5)
+            else:
+                encoded = gzip.compress(body, compresslevel=6)
+            # Solo guardarlo si la proyección no fue expulsada mientras tanto
+            if projection in entry['etags']:
+                entry['bodies'][(projection, encoding)] = encoded
+        return encoded
+
+
+def conditional_json_response(entry, fields=None):
+    """Respuesta JSON con ETag fuerte, 304 Not Modified y compresión gzip/brotli"""
+    projection, body, etag = _entry_body(entry, fields)
+    
+    encoding = None
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+        encoding = request.accept_encodings.best_match(offered)
+    
+    # El ETag varía con la codificación; el 304 lleva el de la variante negociada
+    response_etag = f"{etag}-{encoding}" if encoding else etag
+    variants = [etag, f"{etag}-gzip", f"{etag}-br"]
+    if any(request.if_none_match.contains(v) for v in variants):
+        response = Response(status=304)
+        response.set_etag(response_etag)
+        response.vary.add('Accept-Encoding')
+        return response
+    
+    if encoding:
+        body = _entry_encoded_body(entry, projection, body, encoding)
+    
+    response = Response(body, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(response_etag)
+    return response
+
 
 class YTDLPExtractor:
     def __init__(self):
@@ -21,7 +429,7 @@ class YTDLPExtractor:
             'skip_download': True,  # Solo extraer info, no descargar
         }
         # Directorios compatibles con Docker
-        self.cookies_dir = os.path.join('/app', 'cookies')
+        self.cookies_dir = COOKIES_DIR
         self.downloads_dir = os.path.join('/app', 'downloads')
         
         # Crear directorios si no existen
@@ -59,13 +467,19 @@ class YTDLPExtractor:
             
             print(f"Intentando acceder a pCloud: {pcloud_url}")
             
+            # Solo es una restricción de IP si pCloud devolvió ese aviso
+            ip_restricted = False
+            last_error = None
+            
             # Estrategia 1: Acceso directo
             try:
                 response = session.get(pcloud_url, headers=headers, timeout=30)
                 if "generated for another IP address" not in response.text:
                     print("✓ Acceso directo exitoso")
                     return self._parse_pcloud_response(response, pcloud_url)
+                ip_restricted = True
             except Exception as e:
+                last_error = e
                 print(f"❌ Acceso directo falló: {e}")
             
             # Estrategia 2: Regenerar el enlace usando la API de pCloud
@@ -79,7 +493,9 @@ class YTDLPExtractor:
                         response = session.get(new_url, headers=headers, timeout=30)
                         if "generated for another IP address" not in response.text:
                             return self._parse_pcloud_response(response, new_url)
+                        ip_restricted = True
             except Exception as e:
+                last_error = e
                 print(f"❌ Regeneración falló: {e}")
             
             # Estrategia 3: Múltiples intentos con diferentes User-Agents
@@ -102,8 +518,10 @@ class YTDLPExtractor:
                     if "generated for another IP address" not in response.text:
                         print(f"✓ Éxito con User-Agent {i+1}")
                         return self._parse_pcloud_response(response, pcloud_url)
+                    ip_restricted = True
                         
                 except Exception as e:
+                    last_error = e
                     print(f"❌ User-Agent {i+1} falló: {e}")
                     continue
             
@@ -129,10 +547,16 @@ class YTDLPExtractor:
                     if "generated for another IP address" not in response.text:
                         print(f"✓ Éxito con IP proxy: {ip}")
                         return self._parse_pcloud_response(response, pcloud_url)
+                    ip_restricted = True
                         
                 except Exception as e:
+                    last_error = e
                     continue
             
+            if not ip_restricted:
+                # Sin aviso de IP: fallo de red o de la página, no una restricción de IP
+                raise ExtractionError(f"No se pudo acceder a pCloud: {last_error}")
+            
             # Si todas las estrategias fallan, dar instrucciones al usuario
             raise Exception("""
             🚫 No se pudo acceder al enlace de pCloud debido a restricciones de IP.
@@ -147,11 +571,11 @@ class YTDLPExtractor:
             """)
             
         except requests.RequestException as e:
-            raise Exception(f"Error al acceder a pCloud: {str(e)}")
+            raise ExtractionError(f"Error al acceder a pCloud: {str(e)}")
         except json.JSONDecodeError as e:
-            raise Exception(f"Error al parsear JSON de pCloud: {str(e)}")
+            raise ExtractionError(f"Error al parsear JSON de pCloud: {str(e)}")
         except Exception as e:
-            raise Exception(f"Error procesando pCloud: {str(e)}")
+            raise ExtractionError(f"Error procesando pCloud: {str(e)}")
     
     def _extract_pcloud_code(self, url):
         """Extrae el código del enlace de pCloud"""
@@ -258,9 +682,21 @@ class YTDLPExtractor:
             f.write(cookies_content)
         return cookies_path
     
-    def prepare_ydl_opts(self, cookies_file=None, cookies_dict=None, headers=None):
-        """Prepara opciones de yt-dlp con cookies y headers"""
+    def get_profile(self, profile):
+        """Devuelve la configuración de un perfil de extracción"""
+        if profile not in EXTRACTION_PROFILES:
+            raise ValueError(
+                f"Unknown profile '{profile}'. Available: {', '.join(EXTRACTION_PROFILES)}"
+            )
+        return EXTRACTION_PROFILES[profile]
+    
+    def prepare_ydl_opts(self, cookies_file=None, cookies_dict=None, headers=None, profile='full',
+                         format_selector=None):
+        """Prepara opciones de yt-dlp con cookies, headers y perfil de extracción"""
         opts = self.base_ydl_opts.copy()
+        opts.update(self.get_profile(profile)['ydl_opts'])
+        if format_selector:
+            opts['format'] = format_selector
         
         # Agregar cookies desde archivo
         if cookies_file and os.path.exists(cookies_file):
@@ -288,9 +724,35 @@ class YTDLPExtractor:
             lines.append(line)
         return '\n'.join(lines)
     
-    def extract_info(self, url, extract_formats=True, cookies_file=None, cookies_dict=None, headers=None):
+    def _needs_processing(self, info):
+        """Indica si un resultado sin procesar todavía no tiene los formatos resueltos"""
+        result_type = info.get('_type', 'video')
+        if result_type in ('url', 'url_transparent'):
+            return True
+        return result_type == 'video' and 'formats' not in info and 'url' in info
+    
+    def _sanitize_formats(self, info):
+        """Completa format_id, ext y protocol como lo haría el procesado de yt-dlp"""
+        for i, fmt in enumerate(info.get('formats') or []):
+            if not fmt.get('url'):
+                continue
+            if not fmt.get('format_id'):
+                fmt['format_id'] = str(i)
+            else:
+                fmt['format_id'] = re.sub(r'[\s,/+\[\]()]', '_', fmt['format_id'])
+            if fmt.get('ext') is None:
+                fmt['ext'] = determine_ext(fmt['url']).lower()
+            if fmt.get('protocol') is None:
+                fmt['protocol'] = determine_protocol(fmt)
+    
+    def extract_info(self, url, extract_formats=True, cookies_file=None, cookies_dict=None, headers=None,
+                     profile='full', format_selector=None):
         """Extrae información del video usando yt-dlp o pCloud"""
         try:
+            if not extract_formats:
+                profile = 'metadata_only'
+            profile_config = self.get_profile(profile)
+            
             # Verificar si es un enlace de pCloud
             if self.is_pcloud_link(url):
                 hls_formats, basic_info = self.extract_pcloud_m3u8(url)
@@ -300,18 +762,29 @@ class YTDLPExtractor:
                 return info
             
             # Usar yt-dlp para otros sitios
-            opts = self.prepare_ydl_opts(cookies_file, cookies_dict, headers)
-            if not extract_formats:
-                opts['extract_flat'] = True
+            opts = self.prepare_ydl_opts(cookies_file, cookies_dict, headers, profile, format_selector)
             
             with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(url, download=False)
+                if profile_config['process']:
+                    return ydl.extract_info(url, download=False)
+                
+                # Sin procesado: evita ordenar/seleccionar formatos y los post-procesos
+                info = ydl.extract_info(url, download=False, process=False)
+                if self._needs_processing(info):
+                    info = ydl.process_ie_result(info, download=False)
+                else:
+                    self._sanitize_formats(info)
+                if not info.get('thumbnail') and info.get('thumbnails'):
+                    info['thumbnail'] = info['thumbnails'][-1].get('url')
                 return info
                 
+        except UPSTREAM_ERRORS as e:
+            raise ExtractionError(f"Error extracting info: {str(e)}") from e
         except Exception as e:
             raise Exception(f"Error extracting info: {str(e)}")
     
-    def get_hls_urls(self, url, cookies_file=None, cookies_dict=None, headers=None):
+    def get_hls_urls(self, url, cookies_file=None, cookies_dict=None, headers=None, profile='hls_only',
+                     format_selector=None):
         """Extrae URLs HLS específicamente"""
         try:
             # Para pCloud, usar método específico
@@ -320,7 +793,8 @@ class YTDLPExtractor:
                 return hls_formats, basic_info
             
             # Para otros sitios, usar yt-dlp
-            info = self.extract_info(url, cookies_file=cookies_file, cookies_dict=cookies_dict, headers=headers)
+            info = self.extract_info(url, cookies_file=cookies_file, cookies_dict=cookies_dict, headers=headers,
+                                     profile=profile, format_selector=format_selector)
             hls_formats = []
             
             if 'formats' in info:
@@ -357,27 +831,133 @@ class YTDLPExtractor:
                         })
             
             return hls_formats, info
+        except UPSTREAM_ERRORS as e:
+            raise ExtractionError(f"Error getting HLS URLs: {str(e)}") from e
         except Exception as e:
             raise Exception(f"Error getting HLS URLs: {str(e)}")
     
-    def get_best_hls(self, url, cookies_file=None, cookies_dict=None, headers=None):
-        """Obtiene la mejor calidad HLS disponible"""
+    def get_best_hls(self, url, cookies_file=None, cookies_dict=None, headers=None,
+                     max_height=None, max_bandwidth=None, profile='best_only'):
+        """Obtiene la mejor calidad HLS disponible (opcionalmente limitada por altura y bitrate)"""
         try:
-            hls_formats, info = self.get_hls_urls(url, cookies_file, cookies_dict, headers)
+            format_selector = None
+            if self.get_profile(profile)['process']:
+                format_selector = best_hls_format_selector(max_height, max_bandwidth)
+            hls_formats, info = self.get_hls_urls(url, cookies_file, cookies_dict, headers, profile,
+                                                  format_selector)
             
             if not hls_formats:
                 return None, info
             
-            # Ordenar por calidad (height y tbr)
-            best_format = max(hls_formats, key=lambda x: (
-                x.get('height', 0),
-                x.get('tbr', 0)
-            ))
+            # Formato ya elegido por yt-dlp con el selector
+            if format_selector and info.get('format_id'):
+                for fmt in hls_formats:
+                    if fmt.get('format_id') == info['format_id']:
+                        return fmt, info
+            
+            # pCloud y perfiles sin procesado: elegir aquí
+            def quality(fmt):
+                return (fmt.get('height') or 0, fmt.get('tbr') or 0)
+            
+            # Aplicar límites de altura y bitrate (kbps)
+            candidates = [
+                fmt for fmt in hls_formats
+                if (not max_height or (fmt.get('height') or 0) <= max_height)
+                and (not max_bandwidth or (fmt.get('tbr') or 0) <= max_bandwidth)
+            ]
+            
+            if candidates:
+                # Ordenar por calidad (height y tbr)
+                best_format = max(candidates, key=quality)
+            else:
+                # Ningún formato cumple los límites: el de menor calidad
+                best_format = min(hls_formats, key=quality)
             
             return best_format, info
+        except UPSTREAM_ERRORS as e:
+            raise ExtractionError(f"Error getting best HLS: {str(e)}") from e
         except Exception as e:
             raise Exception(f"Error getting best HLS: {str(e)}")
     
+    def get_all_formats(self, url, filter_protocol=None, profile='full', cookies_file=None, cookies_dict=None,
+                        headers=None):
+        """Obtiene todos los formatos (opcionalmente filtrados por protocolo)"""
+        info = self.extract_info(url, cookies_file=cookies_file, cookies_dict=cookies_dict, headers=headers,
+                                 profile=profile)
+        
+        formats = []
+        if 'formats' in info:
+            for fmt in info['formats']:
+                format_info = {
+                    'format_id': fmt.get('format_id'),
+                    'url': fmt.get('url'),
+                    'ext': fmt.get('ext'),
+                    'protocol': fmt.get('protocol'),
+                    'quality': fmt.get('quality'),
+                    'height': fmt.get('height'),
+                    'width': fmt.get('width'),
+                    'fps': fmt.get('fps'),
+                    'tbr': fmt.get('tbr'),
+                    'abr': fmt.get('abr'),
+                    'vbr': fmt.get('vbr'),
+                    'format_note': fmt.get('format_note'),
+                    'filesize': fmt.get('filesize'),
+                    'language': fmt.get('language'),
+                    'referer': fmt.get('referer'),
+                    'expires': fmt.get('expires'),
+                    'host': fmt.get('host'),
+                    'source': fmt.get('source')
+                }
+                
+                # Filtrar por protocolo si se especifica
+                if filter_protocol:
+                    if fmt.get('protocol') == filter_protocol:
+                        formats.append(format_info)
+                else:
+                    formats.append(format_info)
+        
+        return formats, info
+    
+    def list_playlist_entries(self, url, offset=0, limit=PLAYLIST_DEFAULT_LIMIT,
+                              cookies_file=None, cookies_dict=None, headers=None):
+        """Enumera una página de entradas de una playlist/canal sin resolverlas (extract_flat)"""
+        try:
+            opts = self.prepare_ydl_opts(cookies_file, cookies_dict, headers, 'metadata_only')
+            opts.update({
+                'extract_flat': 'in_playlist',
+                'noplaylist': False,
+                'lazy_playlist': True,
+                'playlistend': None,
+                # Un elemento extra para saber si quedan más páginas
+                'playlist_items': f"{offset + 1}:{offset + limit + 1}",
+            })
+            
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                # Sin procesado: un vídeo suelto no pasa por la selección de formatos
+                info = ydl.extract_info(url, download=False, process=False)
+                for _ in range(5):
+                    if info.get('_type') not in ('url', 'url_transparent'):
+                        break
+                    # Redirecciones (p. ej. canal -> pestaña de vídeos)
+                    info = ydl.extract_info(info['url'], download=False, process=False,
+                                            ie_key=info.get('ie_key'))
+                if info.get('_type') == 'playlist':
+                    # Aplica playlist_items y deja las entradas sin resolver (extract_flat)
+                    info = ydl.process_ie_result(info, download=False)
+            
+            if info.get('_type') != 'playlist':
+                # No es una playlist: una única entrada con la propia URL
+                entries = [{'url': url, 'title': info.get('title')}] if offset == 0 else []
+            else:
+                entries = [entry for entry in info.get('entries') or [] if entry]
+            
+            has_more = len(entries) > limit
+            return entries[:limit], has_more, info
+        except UPSTREAM_ERRORS as e:
+            raise ExtractionError(f"Error listing playlist entries: {str(e)}") from e
+        except Exception as e:
+            raise Exception(f"Error listing playlist entries: {str(e)}")
+    
     def get_supported_sites(self):
         """Lista sitios soportados por yt-dlp + pCloud"""
         try:
@@ -448,13 +1028,164 @@ def pcloud_helper():
         }
     })
 
+def _ndjson(obj):
+    return dumps_json(obj) + b'\n'
+
+def playlist_mode_error(url):
+    """Error 400 para playlists/canales fuera del modo playlist"""
+    return jsonify({
+        'error': 'URL is a playlist or channel. Use playlist mode to fetch its entries in pages.',
+        'is_playlist': True,
+        'example': {'url': url, 'playlist': True, 'limit': PLAYLIST_DEFAULT_LIMIT}
+    }), 400
+
+def _stream_playlist(data, url, profile, resolve_entry, formats_key, cookies_file, cookies_dict, headers,
+                     fingerprint, temp_cookies_file=None):
+    """Enumera una página de la playlist y transmite cada entrada resuelta como NDJSON
+    
+    resolve_entry(extractor, entry_url, cookies_file, headers) devuelve (formatos, info).
+    """
+    temp_files = [temp_cookies_file] if temp_cookies_file else []
+    
+    def cleanup():
+        for path in temp_files:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    try:
+        try:
+            limit = min(parse_positive_int(data.get('limit'), 'limit') or PLAYLIST_DEFAULT_LIMIT,
+                        PLAYLIST_MAX_LIMIT)
+            concurrency = min(parse_positive_int(data.get('concurrency'), 'concurrency')
+                              or PLAYLIST_DEFAULT_CONCURRENCY, PLAYLIST_MAX_CONCURRENCY)
+            cursor = data.get('cursor')
+            if cursor:
+                offset = decode_playlist_cursor(url, cursor)
+            else:
+                offset = parse_non_negative_int(data.get('offset'), 'offset') or 0
+            fields = parse_fields(data.get('fields') or request.args.get('fields'))
+        except (TypeError, ValueError) as e:
+            cleanup()
+            return jsonify({'error': str(e)}), 400
+        
+        # Claves de la caché negativa: el listado y las entradas por separado
+        endpoint = request.endpoint
+        listing_key = (endpoint, url, 'playlist', fingerprint)
+        failure = failure_cache.get(listing_key)
+        if failure:
+            cleanup()
+            return failure_response(failure, cached=True)
+        
+        extractor = YTDLPExtractor()
+        
+        # Un único archivo de cookies para todas las entradas (se resuelven en paralelo)
+        if cookies_dict:
+            temp_file = f"playlist_cookies_{fingerprint[:12]}_{time.time_ns()}.txt"
+            cookies_file = extractor.save_cookies_file(extractor.dict_to_netscape_cookies(cookies_dict), temp_file)
+            temp_files.append(cookies_file)
+            cookies_dict = None
+        
+        try:
+            entries, has_more, info = extractor.list_playlist_entries(
+                url, offset, limit, cookies_file, cookies_dict, headers)
+        except Exception as e:
+            cleanup()
+            return extraction_error_response(listing_key, e)
+    except Exception as e:
+        cleanup()
+        return jsonify({'error': str(e)}), 500
+    
+    def resolve(entry):
+        entry_url = entry.get('webpage_url') or entry.get('url')
+        entry_key = (endpoint, entry_url, profile, fingerprint)
+        failure = failure_cache.get(entry_key)
+        if failure:
+            raise ExtractionError(failure['error'])
+        entry_cookies = None
+        try:
+            if cookies_file and os.path.exists(cookies_file):
+                # yt-dlp reescribe el archivo de cookies al cerrar: cada entrada usa su copia
+                entry_cookies = os.path.join(
+                    extractor.cookies_dir, f"entry_cookies_{time.time_ns()}_{threading.get_ident()}.txt")
+                shutil.copyfile(cookies_file, entry_cookies)
+            formats, entry_info = resolve_entry(extractor, entry_url, entry_cookies or cookies_file, headers)
+        except Exception as e:
+            failure_cache.record(entry_key, e)
+            raise
+        finally:
+            if entry_cookies and os.path.exists(entry_cookies):
+                os.remove(entry_cookies)
+        return entry_url, formats, entry_info
+    
+    def generate():
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            yield _ndjson({
+                'type': 'playlist',
+                'url': url,
+                'title': info.get('title'),
+                'offset': offset,
+                'count': len(entries),
+                'profile': profile
+            })
+            
+            futures = {pool.submit(resolve, entry): (offset + i, entry) for i, entry in enumerate(entries)}
+            # Se emite cada entrada según termina, no en orden
+            for future in as_completed(futures):
+                index, entry = futures[future]
+                try:
+                    entry_url, formats, entry_info = future.result()
+                    yield _ndjson({
+                        'type': 'entry',
+                        'index': index,
+                        'success': True,
+                        'url': entry_url,
+                        'title': entry_info.get('title', entry.get('title')),
+                        'duration': entry_info.get('duration'),
+                        f'{formats_key}_count': len(formats),
+                        formats_key: project_formats(formats, fields)
+                    })
+                except Exception as e:
+                    yield _ndjson({
+                        'type': 'entry',
+                        'index': index,
+                        'success': False,
+                        'url': entry.get('webpage_url') or entry.get('url'),
+                        'title': entry.get('title'),
+                        'error': str(e),
+                        'error_category': error_category(e)
+                    })
+            
+            next_offset = offset + len(entries)
+            yield _ndjson({
+                'type': 'end',
+                'next_offset': next_offset if has_more else None,
+                'next_cursor': encode_playlist_cursor(url, next_offset) if has_more else None,
+                'has_more': has_more
+            })
+        finally:
+            # Si el cliente se desconecta, no seguir resolviendo entradas
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Se ejecuta al cerrar la respuesta aunque el generador no haya llegado a arrancar
+    response.call_on_close(cleanup)
+    return response
+
 @app.route('/extract', methods=['POST'])
 def extract_hls():
-    """Extrae URLs HLS de un video (incluyendo pCloud)"""
+    """Extrae URLs HLS de un video (incluyendo pCloud) o de una playlist/canal"""
     try:
         data = request.json
         url = data.get('url')
         best_only = data.get('best_only', False)
+        profile = data.get('profile') or ('best_only' if best_only else 'hls_only')
+        try:
+            max_height = parse_positive_int(data.get('max_height'), 'max_height')
+            max_bandwidth = parse_positive_int(data.get('max_bandwidth'), 'max_bandwidth')  # kbps
+            fields = parse_fields(data.get('fields') or request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Opciones de autenticación
         cookies_file = data.get('cookies_file')  # Ruta al archivo de cookies
@@ -465,8 +1196,38 @@ def extract_hls():
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
+        if not isinstance(url, str):
+            return jsonify({'error': 'url must be a string'}), 400
+        
+        if cookies_dict is not None and not isinstance(cookies_dict, dict):
+            return jsonify({'error': 'cookies must be an object {name: value}'}), 400
+        
+        if headers is not None and not isinstance(headers, dict):
+            return jsonify({'error': 'headers must be an object {name: value}'}), 400
+        
+        if cookies_content is not None and not isinstance(cookies_content, str):
+            return jsonify({'error': 'cookies_content must be a string'}), 400
+        
+        if profile not in EXTRACTION_PROFILES:
+            return jsonify({'error': f"Unknown profile '{profile}'"}), 400
+        
+        # Respuesta ya extraída recientemente: sin extraer ni re-serializar
+        fingerprint = auth_fingerprint(cookies_file, cookies_dict, headers, cookies_content)
+        cache_key = ('extract', url, profile, bool(best_only), max_height, max_bandwidth, fingerprint)
+        if not data.get('playlist'):
+            cached = extraction_cache.get(cache_key)
+            if cached:
+                return conditional_json_response(cached, fields)
+            
+            # Fallo reciente con las mismas credenciales: devolver el error guardado
+            failure_key = ('extract_hls', url, profile, fingerprint)
+            failure = failure_cache.get(failure_key)
+            if failure:
+                return failure_response(failure, cached=True)
+        
         extractor = YTDLPExtractor()
         temp_cookies_file = None
+        streaming = False
         
         try:
             # Si se envió contenido de cookies, crear archivo temporal
@@ -475,16 +1236,37 @@ def extract_hls():
                 temp_cookies_file = extractor.save_cookies_file(cookies_content, temp_file)
                 cookies_file = temp_cookies_file
             
-            if best_only:
-                best_format, info = extractor.get_best_hls(url, cookies_file, cookies_dict, headers)
-                hls_formats = [best_format] if best_format else []
-            else:
-                hls_formats, info = extractor.get_hls_urls(url, cookies_file, cookies_dict, headers)
+            # Modo playlist: el stream se encarga de borrar las cookies temporales
+            if data.get('playlist'):
+                def resolve_entry(extractor, entry_url, cookies_file, headers):
+                    if best_only:
+                        best_format, entry_info = extractor.get_best_hls(
+                            entry_url, cookies_file, None, headers, max_height, max_bandwidth, profile)
+                        return ([best_format] if best_format else []), entry_info
+                    return extractor.get_hls_urls(entry_url, cookies_file, None, headers, profile)
+                
+                streaming = True
+                return _stream_playlist(data, url, profile, resolve_entry, 'hls_formats', cookies_file,
+                                        cookies_dict, headers, fingerprint, temp_cookies_file)
+            
+            try:
+                if best_only:
+                    best_format, info = extractor.get_best_hls(url, cookies_file, cookies_dict, headers,
+                                                               max_height, max_bandwidth, profile)
+                    hls_formats = [best_format] if best_format else []
+                else:
+                    hls_formats, info = extractor.get_hls_urls(url, cookies_file, cookies_dict, headers,
+                                                               profile)
+            except Exception as e:
+                return extraction_error_response(failure_key, e)
+            
+            if info.get('_type') == 'playlist':
+                return playlist_mode_error(url)
             
             # Detectar si es pCloud
             is_pcloud = extractor.is_pcloud_link(url)
             
-            return jsonify({
+            entry = extraction_cache.set(cache_key, {
                 'success': True,
                 'url': url,
                 'title': info.get('title', 'Unknown'),
@@ -496,12 +1278,14 @@ def extract_hls():
                 'used_cookies': bool(cookies_file or cookies_dict),
                 'used_headers': bool(headers),
                 'source': 'pcloud' if is_pcloud else 'yt-dlp',
+                'profile': profile,
                 'is_pcloud': is_pcloud
-            })
+            }, 'hls_formats')
+            return conditional_json_response(entry, fields)
         
         finally:
             # Limpiar archivo temporal de cookies
-            if temp_cookies_file and os.path.exists(temp_cookies_file):
+            if not streaming and temp_cookies_file and os.path.exists(temp_cookies_file):
                 os.remove(temp_cookies_file)
     
     except Exception as e:
@@ -514,55 +1298,59 @@ def get_all_formats():
         data = request.json
         url = data.get('url')
         filter_protocol = data.get('protocol')  # 'm3u8', 'http', etc.
+        profile = data.get('profile', 'full')
+        try:
+            fields = parse_fields(data.get('fields') or request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         if not url:
             return jsonify({'error': 'URL is required'}), 400
         
+        if not isinstance(url, str):
+            return jsonify({'error': 'url must be a string'}), 400
+        
+        if profile not in EXTRACTION_PROFILES:
+            return jsonify({'error': f"Unknown profile '{profile}'"}), 400
+        
+        if data.get('playlist'):
+            def resolve_entry(extractor, entry_url, cookies_file, headers):
+                return extractor.get_all_formats(entry_url, filter_protocol, profile)
+            
+            return _stream_playlist(data, url, profile, resolve_entry, 'formats', None, None, None,
+                                    auth_fingerprint())
+        
+        cache_key = ('formats', url, filter_protocol, profile)
+        cached = extraction_cache.get(cache_key)
+        if cached:
+            return conditional_json_response(cached, fields)
+        
+        failure_key = ('get_all_formats', url, profile, auth_fingerprint())
+        failure = failure_cache.get(failure_key)
+        if failure:
+            return failure_response(failure, cached=True)
+        
         extractor = YTDLPExtractor()
-        info = extractor.extract_info(url)
+        try:
+            formats, info = extractor.get_all_formats(url, filter_protocol, profile)
+        except Exception as e:
+            return extraction_error_response(failure_key, e)
         
-        formats = []
-        if 'formats' in info:
-            for fmt in info['formats']:
-                format_info = {
-                    'format_id': fmt.get('format_id'),
-                    'url': fmt.get('url'),
-                    'ext': fmt.get('ext'),
-                    'protocol': fmt.get('protocol'),
-                    'quality': fmt.get('quality'),
-                    'height': fmt.get('height'),
-                    'width': fmt.get('width'),
-                    'fps': fmt.get('fps'),
-                    'tbr': fmt.get('tbr'),
-                    'abr': fmt.get('abr'),
-                    'vbr': fmt.get('vbr'),
-                    'format_note': fmt.get('format_note'),
-                    'filesize': fmt.get('filesize'),
-                    'language': fmt.get('language'),
-                    'referer': fmt.get('referer'),
-                    'expires': fmt.get('expires'),
-                    'host': fmt.get('host'),
-                    'source': fmt.get('source')
-                }
-                
-                # Filtrar por protocolo si se especifica
-                if filter_protocol:
-                    if fmt.get('protocol') == filter_protocol:
-                        formats.append(format_info)
-                else:
-                    formats.append(format_info)
+        if info.get('_type') == 'playlist':
+            return playlist_mode_error(url)
         
         # Detectar si es pCloud
         is_pcloud = extractor.is_pcloud_link(url)
         
-        return jsonify({
+        entry = extraction_cache.set(cache_key, {
             'success': True,
             'url': url,
             'title': info.get('title'),
             'formats_count': len(formats),
             'formats': formats,
             'is_pcloud': is_pcloud
-        })
+        }, 'formats')
+        return conditional_json_response(entry, fields)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -682,8 +1470,8 @@ def home():
     return jsonify({
         'message': 'yt-dlp HLS Extractor API with Cookies Support + pCloud',
         'endpoints': {
-            'POST /extract': 'Extract HLS URLs from video (supports pCloud)',
-            'POST /formats': 'Get all available formats (supports pCloud)',
+            'POST /extract': 'Extract HLS URLs from video (supports pCloud, playlist mode streams NDJSON)',
+            'POST /formats': 'Get all available formats (supports pCloud, playlist mode streams NDJSON)',
             'POST /download': 'Download video (not supported for pCloud)',
             'POST /upload-cookies': 'Upload cookies file',
             'GET /cookies': 'List uploaded cookies files',
@@ -700,6 +1488,28 @@ def home():
             'cookies_content': 'Raw cookies file content',
             'headers': 'Custom HTTP headers'
         },
+        'response_options': {
+            'fields': 'Comma-separated format fields to return, e.g. "format_id,height,url"',
+            'If-None-Match': 'ETag from a previous response; returns 304 while the extraction is cached',
+            'Accept-Encoding': 'gzip or br for large responses'
+        },
+        'failed_extractions': {
+            'description': 'Failures are cached per URL and cookies/headers; send new cookies or headers to retry immediately',
+            'ttl_seconds': NEGATIVE_CACHE_TTLS
+        },
+        'extraction_profiles': {
+            'full': 'Full yt-dlp processing (default for /formats)',
+            'hls_only': 'Skip DASH, subtitles and format sorting (default for /extract)',
+            'best_only': 'yt-dlp format selection of the best HLS, accepts max_height and max_bandwidth (kbps)',
+            'metadata_only': 'extract_flat, no manifests fetched'
+        },
+        'playlist_options': {
+            'playlist': 'true (on /extract or /formats) to enumerate a playlist/channel and stream one NDJSON line per entry',
+            'offset': 'First entry to resolve (default 0)',
+            'limit': f'Entries per page (default {PLAYLIST_DEFAULT_LIMIT}, max {PLAYLIST_MAX_LIMIT})',
+            'cursor': 'next_cursor from a previous response, replaces offset',
+            'concurrency': f'Entries resolved in parallel (default {PLAYLIST_DEFAULT_CONCURRENCY}, max {PLAYLIST_MAX_CONCURRENCY})'
+        },
         'examples': {
             'pcloud_extract': {
                 'url': 'POST /extract',
@@ -708,6 +1518,24 @@ def home():
                     'best_only': True
                 }
             },
+            'best_only_constrained': {
+                'url': 'POST /extract',
+                'body': {
+                    'url': 'https://example.com/video',
+                    'best_only': True,
+                    'max_height': 720,
+                    'max_bandwidth': 3000
+                }
+            },
+            'playlist_page': {
+                'url': 'POST /extract',
+                'body': {
+                    'url': 'https://www.youtube.com/@channel/videos',
+                    'playlist': True,
+                    'best_only': True,
+                    'limit': 20
+                }
+            },
             'extract_with_cookies_dict': {
                 'url': 'POST /extract',
                 'body': {
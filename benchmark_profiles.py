@@ -0,0 +1,100 @@
+"""Benchmark de perfiles de extracción
+
+Cuenta las peticiones HTTP salientes (yt-dlp y requests) y mide la latencia
+de extract_info para cada perfil definido en EXTRACTION_PROFILES.
+
+Uso:
+    python benchmark_profiles.py URL [URL ...] [--runs 3] [--profiles hls_only,best_only]
+"""
+import argparse
+import statistics
+import time
+
+import requests
+import yt_dlp
+
+from app import EXTRACTION_PROFILES, YTDLPExtractor
+
+
+class RequestCounter:
+    """Envuelve los puntos de salida HTTP para contar peticiones"""
+    def __init__(self):
+        self.count = 0
+        self._depth = 0
+        self._originals = {}
+
+    def _wrap(self, owner, name):
+        original = getattr(owner, name)
+        self._originals[(owner, name)] = original
+        counter = self
+
+        def wrapper(*args, **kwargs):
+            # yt-dlp puede usar requests internamente: contar solo la llamada externa
+            if counter._depth == 0:
+                counter.count += 1
+            counter._depth += 1
+            try:
+                return original(*args, **kwargs)
+            finally:
+                counter._depth -= 1
+
+        setattr(owner, name, wrapper)
+
+    def __enter__(self):
+        self.count = 0
+        self._wrap(yt_dlp.YoutubeDL, 'urlopen')
+        self._wrap(requests.Session, 'request')
+        return self
+
+    def __exit__(self, *exc):
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+        self._originals.clear()
+        return False
+
+
+def benchmark(url, profiles, runs):
+    extractor = YTDLPExtractor()
+    results = []
+    for profile in profiles:
+        latencies = []
+        request_counts = []
+        error = None
+        for _ in range(runs):
+            with RequestCounter() as counter:
+                start = time.perf_counter()
+                try:
+                    extractor.extract_info(url, profile=profile)
+                except Exception as e:
+                    error = str(e)
+                latencies.append(time.perf_counter() - start)
+            request_counts.append(counter.count)
+        results.append({
+            'profile': profile,
+            'requests': statistics.median(request_counts),
+            'latency_ms': statistics.median(latencies) * 1000,
+            'error': error,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de perfiles de extracción')
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--profiles', default=','.join(EXTRACTION_PROFILES))
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(',') if p.strip()]
+    for url in args.urls:
+        print(f"\n{url}")
+        print(f"{'profile':<15}{'requests':>10}{'latency (ms)':>15}")
+        for row in benchmark(url, profiles, args.runs):
+            line = f"{row['profile']:<15}{row['requests']:>10}{row['latency_ms']:>15.1f}"
+            if row['error']:
+                line += f"  ERROR: {row['error'][:80]}"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()